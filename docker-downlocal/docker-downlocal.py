@@ -6,27 +6,99 @@ import subprocess
 from datetime import datetime, timedelta
 import configparser
 import re
+import json
+import time
 import zipfile
-import shutil
+import zlib
+import contextlib
+import hashlib
+import pickle
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import docker
+except ImportError:
+    docker = None
 
 CONFIG_FILE = "config_docker-downlocal.conf"
 DOCKER_CLI = "docker"
+CACHE_DIR = os.path.expanduser("~/.cache/docker-downlocal")
+# 待延迟删除的镜像记录
+PENDING_FILE = os.path.join(CACHE_DIR, "pending.json")
+# 最近一次远程版本检查的记录及有效期（秒）
+CHECKED_DIR = os.path.join(CACHE_DIR, "checked")
+CHECK_TTL = 300
+# 配置解析结果缓存，配置项变化时递增版本号使旧缓存失效
+CONFIG_CACHE = os.path.join(CACHE_DIR, "config.pkl")
+CONFIG_CACHE_VERSION = 3
+# 本地registry容器名及默认端口
+REGISTRY_CONTAINER = "docker-downlocal-registry"
+REGISTRY_DEFAULT_PORT = "5000"
+
+RE_UNSAFE_NAME = re.compile(r'[^a-zA-Z0-9_./-]')
+RE_PATH_SEP = re.compile(r'[:/]')
+
+# 压缩方式: (文件后缀, 外部压缩命令)
+COMPRESSORS = {
+    'zip': ('.zip', None),
+    'zstd': ('.tar.zst', ['zstd', '-T0', '-3', '-q', '-c']),
+    'pigz': ('.tar.gz', ['pigz', '-1', '-p', str(os.cpu_count() or 1), '-c']),
+    'none': ('.tar', None),
+}
+# 采样压缩率高于该值时视为已压缩数据，zip 改用存储模式
+INCOMPRESSIBLE_RATIO = 0.95
+# 远程manifest查询超时（秒）
+MANIFEST_TIMEOUT = 10
+# 读取docker pull输出的块大小
+PULL_READ_SIZE = 1 << 16
+# 管道读写及队列中每块数据的大小
+STREAM_BUFSIZE = 4 << 20
+# docker save 与压缩线程之间的队列长度
+STREAM_QUEUE_SIZE = 8
 
 class DockerImageManager:
     def __init__(self):
         self.config = None
         self.remote_path = ""
         self.registry_mirrors = []
+        self.compression = 'zip'
+        self.zip_level = 1
+        self.local_registry = 'localhost:5000'
+        self.digest_cache = {}
+        self.api = None
         self.image_info = {
             'original_name': '',
             'original_tag': 'latest',
             'arch': 'amd64',
             'mirror': None,
+            'pull_ref_base': '',
             'tar_name': '',
-            'zip_name': '',
-            'pulled_ref': ''
+            'archive_name': '',
+            'checksum_name': '',
+            'sha256': '',
+            'pulled_ref': '',
+            'mirror_ref': '',
+            'registry_ref': ''
         }
 
+    def connect_api(self):
+        """安装了docker SDK时复用同一个守护进程连接，否则回退到docker命令行"""
+        if docker is None:
+            return
+        try:
+            api = docker.APIClient(**docker.utils.kwargs_from_env())
+            api.ping()
+            self.api = api
+        except Exception:
+            self.api = None
+
     def handle_config(self):
         """处理配置文件"""
         if not os.path.exists(CONFIG_FILE):
@@ -35,21 +107,63 @@ class DockerImageManager:
             print("请填写配置后重新运行程序")
             sys.exit(0)
         
+        values = self.load_config_cached()
+        # 未配置时输出到当前目录
+        self.remote_path = values['remote_path'] or os.curdir
+        self.registry_mirrors = values['registry_mirrors']
+        self.compression = values['compression']
+        self.zip_level = values['zip_level']
+        self.local_registry = values['local_registry']
+        if self.compression not in COMPRESSORS:
+            raise ValueError(f"不支持的压缩方式: {self.compression}（可选: {'/'.join(COMPRESSORS)}）")
+        if not 0 <= self.zip_level <= 9:
+            raise ValueError(f"zip_level 取值范围为 0-9: {self.zip_level}")
+
+    def load_config_cached(self):
+        """读取配置，按(路径, 修改时间, 大小)缓存解析结果"""
+        st = os.stat(CONFIG_FILE)
+        key = (CONFIG_CACHE_VERSION, os.path.abspath(CONFIG_FILE), st.st_mtime_ns, st.st_size)
+        try:
+            with open(CONFIG_CACHE, 'rb') as f:
+                cached_key, values = pickle.load(f)
+            if cached_key == key:
+                return values
+        except Exception:
+            pass
+
+        values = self.parse_config()
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            with open(CONFIG_CACHE, 'wb') as f:
+                pickle.dump((key, values), f)
+        except OSError:
+            pass
+        return values
+
+    def parse_config(self):
         config = configparser.ConfigParser()
         config.read(CONFIG_FILE)
-        self.remote_path = config['DEFAULT'].get('remote_path', '/tmp/docker-images')
-        self.registry_mirrors = [
-            m.strip() for m in 
-            config['DEFAULT'].get('registry_mirrors', '').split(',') 
-            if m.strip()
-        ]
+        return {
+            'remote_path': config['DEFAULT'].get('remote_path', '/tmp/docker-images'),
+            'registry_mirrors': [
+                m.strip() for m in 
+                config['DEFAULT'].get('registry_mirrors', '').split(',') 
+                if m.strip()
+            ],
+            'compression': config['DEFAULT'].get('compression', 'zip').strip().lower() or 'zip',
+            'zip_level': config['DEFAULT'].getint('zip_level', 1),
+            'local_registry': config['DEFAULT'].get('local_registry', 'localhost:5000').strip() or 'localhost:5000'
+        }
 
     def create_config_template(self):
         config = configparser.ConfigParser()
         config['DEFAULT'] = {
             'remote_path': '/tmp/docker-images',
             'registry_mirrors': 'https://registry.docker-cn.com,https://mirror.baidubce.com',
-            '# 说明': '多个加速地址用英文逗号分隔'
+            'compression': 'zip',
+            'zip_level': '1',
+            'local_registry': 'localhost:5000',
+            '# 说明': '多个加速地址用英文逗号分隔；compression 可选 zip/zstd/pigz/none；zip_level 0-9，0 为仅存储；local_registry 为 --via registry 使用的本地仓库'
         }
         with open(CONFIG_FILE, 'w') as f:
             config.write(f)
@@ -62,7 +176,7 @@ class DockerImageManager:
             self.image_info['original_name'] = image_input
         
         # 清理特殊字符但保留路径结构
-        self.image_info['original_name'] = re.sub(r'[^a-zA-Z0-9_./-]', '_', self.image_info['original_name'])
+        self.image_info['original_name'] = RE_UNSAFE_NAME.sub('_', self.image_info['original_name'])
 
     def select_architecture(self):
         arch_map = {
@@ -101,7 +215,7 @@ class DockerImageManager:
                     return
             print("无效输入，请重新选择")
 
-    def get_pull_reference(self):
+    def compute_pull_reference(self):
         """构造拉取用的镜像引用"""
         name = self.image_info['original_name']
         if self.image_info['mirror']:
@@ -113,43 +227,108 @@ class DockerImageManager:
                 return f"{self.image_info['mirror']}/{name}"
         return name
 
-    def check_image_update(self):
-        """检查镜像是否需要更新"""
-        try:
-            # 检查本地镜像
-            inspect_cmd = [
-                DOCKER_CLI, 'inspect',
-                '--format', '{{.Id}}',
-                f"{self.get_pull_reference()}:{self.image_info['original_tag']}"
-            ]
-            result = subprocess.run(
-                inspect_cmd,
-                capture_output=True,
-                text=True
-            )
-            if result.returncode != 0:
-                return True
+    def get_pull_reference(self):
+        """拉取用的镜像引用，选定镜像源后计算一次"""
+        if not self.image_info['pull_ref_base']:
+            self.image_info['pull_ref_base'] = self.compute_pull_reference()
+        return self.image_info['pull_ref_base']
+
+    def fetch_local_id(self):
+        """获取本地镜像ID"""
+        ref = f"{self.get_pull_reference()}:{self.image_info['original_tag']}"
+        if self.api is not None:
+            try:
+                return self.api.inspect_image(ref)['Id']
+            except docker.errors.ImageNotFound:
+                return None
 
-            # 获取远程manifest
-            manifest_cmd = [
-                DOCKER_CLI, 'manifest', 'inspect',
-                f"{self.image_info['original_name']}:{self.image_info['original_tag']}"
-            ]
+        result = subprocess.run(
+            [DOCKER_CLI, 'inspect', '--format', '{{.Id}}', ref],
+            capture_output=True,
+            text=True
+        )
+        if result.returncode != 0:
+            return None
+        return result.stdout.strip()
+
+    def fetch_remote_digest(self):
+        """获取远程镜像对应架构的config digest，结果按(name, tag, arch)缓存"""
+        key = (self.image_info['original_name'], self.image_info['original_tag'], self.image_info['arch'])
+        if key not in self.digest_cache:
+            # --verbose 输出包含各平台manifest的config digest，可与本地镜像ID直接比较；
+            # SDK的inspect_distribution不含config digest，这里仍使用命令行
             manifest = subprocess.run(
-                manifest_cmd,
+                [DOCKER_CLI, 'manifest', 'inspect', '--verbose', f"{key[0]}:{key[1]}"],
                 capture_output=True,
-                text=True
+                text=True,
+                timeout=MANIFEST_TIMEOUT
             )
             if manifest.returncode != 0:
+                return None
+            self.digest_cache[key] = self.parse_config_digest(json.loads(manifest.stdout))
+        return self.digest_cache[key]
+
+    def parse_config_digest(self, manifest):
+        """从manifest中选出目标架构的config digest"""
+        arch, _, variant = self.image_info['arch'].partition('/')
+        # 多架构镜像返回列表，单架构镜像返回单个对象
+        entries = manifest if isinstance(manifest, list) else [manifest]
+        for entry in entries:
+            platform = entry.get('Descriptor', {}).get('platform', {})
+            if platform and (
+                platform.get('architecture') != arch
+                or (variant and platform.get('variant') != variant)
+            ):
+                continue
+            image_manifest = entry.get('SchemaV2Manifest') or entry.get('OCIManifest') or {}
+            return image_manifest.get('config', {}).get('digest')
+        return None
+
+    def check_marker_path(self):
+        ref = f"{self.get_pull_reference()}:{self.image_info['original_tag']}@{self.image_info['arch']}"
+        return os.path.join(CHECKED_DIR, f"{hashlib.sha1(ref.encode()).hexdigest()}.ts")
+
+    def recently_checked(self):
+        """近期已确认本地镜像为最新且镜像ID未变时，跳过远程查询"""
+        marker = self.check_marker_path()
+        try:
+            if time.time() - os.stat(marker).st_mtime >= CHECK_TTL:
+                return False
+            with open(marker) as f:
+                checked_id = f.read().strip()
+        except OSError:
+            return False
+        return checked_id == self.fetch_local_id()
+
+    def mark_checked(self, local_id):
+        try:
+            os.makedirs(CHECKED_DIR, exist_ok=True)
+            with open(self.check_marker_path(), 'w') as f:
+                f.write(local_id)
+        except OSError:
+            pass
+
+    def check_image_update(self):
+        """检查镜像是否需要更新"""
+        try:
+            if self.recently_checked():
+                return False
+
+            # 本地inspect与远程manifest查询互不依赖，并发执行
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                local_future = executor.submit(self.fetch_local_id)
+                remote_future = executor.submit(self.fetch_remote_digest)
+                local_id = local_future.result()
+                remote_digest = remote_future.result()
+
+            if local_id is None or remote_digest is None:
                 return True
 
             # 比较digest
-            local_digest = result.stdout.strip().split(':')[1]
-            remote_digest = re.search(
-                r'"digest":\s*"(\w+:\w+)"', 
-                manifest.stdout
-            ).group(1)
-            return local_digest != remote_digest
+            if local_id != remote_digest:
+                return True
+            self.mark_checked(local_id)
+            return False
             
         except Exception as e:
             print(f"版本检查失败: {str(e)}")
@@ -157,39 +336,79 @@ class DockerImageManager:
 
     def pull_image(self):
         """拉取镜像并修正名称"""
+        pull_ref = f"{self.get_pull_reference()}:{self.image_info['original_tag']}"
         if not self.check_image_update():
             print("\n本地镜像已是最新版本")
+            self.image_info['pulled_ref'] = pull_ref
             return
 
-        pull_ref = f"{self.get_pull_reference()}:{self.image_info['original_tag']}"
         platform = f"linux/{self.image_info['arch']}"
-        
+
+        print(f"\n正在拉取镜像: {pull_ref}", flush=True)
+        if self.api is not None:
+            self.pull_image_api(platform)
+        else:
+            self.pull_image_cli(pull_ref, platform)
+
+        # 记录原始拉取引用
+        self.image_info['pulled_ref'] = pull_ref
+
+    def pull_image_api(self, platform):
+        self.print_stream_events(
+            self.api.pull(
+                self.get_pull_reference(),
+                tag=self.image_info['original_tag'],
+                platform=platform,
+                stream=True,
+                decode=True
+            ),
+            "镜像拉取失败"
+        )
+
+    def print_stream_events(self, events, error_message):
+        """输出SDK pull/push 的事件流，遇到错误时抛出"""
+        for event in events:
+            if 'error' in event:
+                raise RuntimeError(f"{error_message}: {event['error']}")
+            # 与非终端下的命令行输出一致，不打印逐块下载进度
+            if event.get('progressDetail'):
+                continue
+            prefix = f"{event['id']}: " if 'id' in event else ''
+            print(f"{prefix}{event.get('status', '')}")
+
+    def pull_image_cli(self, pull_ref, platform):
         cmd = [
             DOCKER_CLI, 'pull',
             '--platform', platform,
             pull_ref
         ]
 
-        print(f"\n正在拉取镜像: {pull_ref}")
+        # 独立会话：Ctrl+C 只打断本进程，由下面统一终止docker pull
         process = subprocess.Popen(
             cmd,
             stdout=subprocess.PIPE,
             stderr=subprocess.STDOUT,
-            text=True
+            bufsize=PULL_READ_SIZE,
+            start_new_session=True
         )
 
-        while True:
-            output = process.stdout.readline()
-            if not output and process.poll() is not None:
-                break
-            print(output.strip())
+        # 按块读取字节直接转发，不做逐行解码
+        try:
+            while True:
+                chunk = process.stdout.read1(PULL_READ_SIZE)
+                if not chunk:
+                    break
+                sys.stdout.buffer.write(chunk)
+                sys.stdout.buffer.flush()
+        except BaseException:
+            process.terminate()
+            raise
+        finally:
+            process.stdout.close()
 
-        if process.returncode != 0:
+        if process.wait() != 0:
             raise RuntimeError("镜像拉取失败")
 
-        # 记录原始拉取引用
-        self.image_info['pulled_ref'] = pull_ref
-
     def rename_image(self):
         """将镜像重命名为原始名称"""
         if not self.image_info['mirror']:
@@ -199,57 +418,201 @@ class DockerImageManager:
         print(f"\n重命名镜像: {self.image_info['pulled_ref']} -> {original_ref}")
         
         try:
-            # 创建新标签
-            subprocess.run(
-                [DOCKER_CLI, 'tag', self.image_info['pulled_ref'], original_ref],
-                check=True
-            )
-            # 删除旧标签
-            subprocess.run(
-                [DOCKER_CLI, 'rmi', self.image_info['pulled_ref']],
-                check=True
-            )
-        except subprocess.CalledProcessError as e:
+            # 只创建新标签，加速源标签留到清理镜像时一并删除，省去一次docker调用
+            if self.api is not None:
+                self.api.tag(
+                    self.image_info['pulled_ref'],
+                    self.image_info['original_name'],
+                    self.image_info['original_tag']
+                )
+            else:
+                subprocess.run(
+                    [DOCKER_CLI, 'tag', self.image_info['pulled_ref'], original_ref],
+                    check=True
+                )
+        except Exception as e:
             print(f"镜像重命名失败: {str(e)}")
             raise
 
         # 更新后续使用的引用
+        self.image_info['mirror_ref'] = self.image_info['pulled_ref']
         self.image_info['pulled_ref'] = original_ref
 
     def generate_filenames(self):
         """生成标准化文件名"""
-        safe_name = re.sub(r'[:/]', '_', self.image_info['original_name'])
+        safe_name = RE_PATH_SEP.sub('_', self.image_info['original_name'])
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         base_name = f"{safe_name}_{self.image_info['original_tag']}_{self.image_info['arch']}_{timestamp}"
         self.image_info['tar_name'] = f"{base_name}.tar"
-        self.image_info['zip_name'] = f"{base_name}.zip"
+        self.image_info['archive_name'] = f"{base_name}{COMPRESSORS[self.compression][0]}"
+        self.image_info['checksum_name'] = f"{base_name}.tar.sha256"
+
+    def is_incompressible(self, sample):
+        """根据采样数据判断是否已基本无法再压缩（镜像层本身为gzip）"""
+        if not sample:
+            return False
+        return len(zlib.compress(sample, 1)) / len(sample) > INCOMPRESSIBLE_RATIO
+
+    def open_sink(self, stack, dest, sample):
+        """按配置的压缩方式打开写入端，资源由stack统一关闭"""
+        # 大缓冲合并deflate/zstd产出的零碎小块，减少write系统调用
+        out = stack.enter_context(open(dest, 'wb', buffering=STREAM_BUFSIZE))
+
+        def sync_output(exc_type, exc, tb):
+            # 成功写完后落盘：压缩包尚为脏页时 POSIX_FADV_DONTNEED 无法释放缓存
+            if exc_type is None and hasattr(os, 'fdatasync'):
+                out.flush()
+                os.fdatasync(out.fileno())
+
+        # 先于压缩端注册，因此在压缩端关闭之后、文件关闭之前执行
+        stack.push(sync_output)
+        if self.compression == 'zip':
+            info = zipfile.ZipInfo(self.image_info['tar_name'], date_time=datetime.now().timetuple()[:6])
+            info.compress_type = zipfile.ZIP_DEFLATED
+            # 自建的ZipInfo不会继承ZipFile的compresslevel，需单独指定
+            info._compresslevel = self.zip_level
+            if self.zip_level == 0:
+                info.compress_type = zipfile.ZIP_STORED
+            elif self.is_incompressible(sample):
+                print("检测到镜像层已压缩，使用存储模式打包")
+                info.compress_type = zipfile.ZIP_STORED
+            zipf = stack.enter_context(zipfile.ZipFile(out, 'w', allowZip64=True))
+            return stack.enter_context(zipf.open(info, 'w', force_zip64=True))
+
+        if self.compression == 'none':
+            return out
+        if self.compression == 'zstd' and zstandard is not None:
+            # 多线程zstd压缩
+            cctx = zstandard.ZstdCompressor(level=3, threads=-1)
+            return stack.enter_context(cctx.stream_writer(out, write_size=STREAM_BUFSIZE, closefd=False))
 
-    def create_tar_package(self):
-        """创建原始tar包"""
-        print(f"\n正在保存镜像到 {self.image_info['tar_name']}...")
-        subprocess.run(
-            [DOCKER_CLI, 'save', '-o', self.image_info['tar_name'], self.image_info['pulled_ref']],
-            check=True
+        process = subprocess.Popen(
+            COMPRESSORS[self.compression][1],
+            stdin=subprocess.PIPE,
+            stdout=out,
+            bufsize=STREAM_BUFSIZE
         )
-        print(f"原始tar包已创建，大小: {os.path.getsize(self.image_info['tar_name'])/1024/1024:.2f}MB")
+        stack.callback(self.wait_compressor, process)
+        return process.stdin
+
+    def wait_compressor(self, process):
+        process.stdin.close()
+        if process.wait() != 0:
+            raise RuntimeError(f"压缩进程异常退出: {process.args[0]}")
+
+    def iter_image_tar(self):
+        """逐块产出 docker save 的tar数据"""
+        if self.api is not None:
+            yield from self.api.get_image(self.image_info['pulled_ref'], chunk_size=STREAM_BUFSIZE)
+            return
 
-    def compress_to_zip(self):
-        """压缩为zip格式"""
-        print(f"\n正在创建压缩包: {self.image_info['zip_name']}")
+        process = subprocess.Popen(
+            [DOCKER_CLI, 'save', self.image_info['pulled_ref']],
+            stdout=subprocess.PIPE,
+            bufsize=STREAM_BUFSIZE
+        )
         try:
-            with zipfile.ZipFile(self.image_info['zip_name'], 'w', zipfile.ZIP_DEFLATED) as zipf:
-                zipf.write(self.image_info['tar_name'], arcname=os.path.basename(self.image_info['tar_name']))
-            print(f"压缩完成，压缩包大小: {os.path.getsize(self.image_info['zip_name'])/1024/1024:.2f}MB")
+            while True:
+                chunk = process.stdout.read(STREAM_BUFSIZE)
+                if not chunk:
+                    break
+                yield chunk
+        finally:
+            process.stdout.close()
+            process.wait()
+        if process.returncode != 0:
+            raise RuntimeError("镜像保存失败")
+
+    def put_chunk(self, chunks_queue, item, stop):
+        """放入队列，消费端已退出时放弃"""
+        while not stop.is_set():
+            try:
+                chunks_queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce_chunks(self, chunks_queue, stop):
+        """生产者线程：读取docker save数据放入有界队列，以None或异常结束"""
+        item = None
+        try:
+            with contextlib.closing(self.iter_image_tar()) as chunks:
+                for chunk in chunks:
+                    if not self.put_chunk(chunks_queue, chunk, stop):
+                        return
+        except BaseException as e:
+            item = e
+        finally:
+            # 无论如何退出都要通知消费端，否则主线程会一直阻塞在队列上
+            self.put_chunk(chunks_queue, item, stop)
+
+    def iter_queue(self, chunks_queue):
+        while True:
+            item = chunks_queue.get()
+            if item is None:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+
+    def part_path(self):
+        """写入过程中的临时文件，完成后重命名为正式文件"""
+        if not self.image_info['archive_name']:
+            return ''
+        return os.path.join(self.remote_path, f"{self.image_info['archive_name']}.part")
+
+    def save_and_compress_streaming(self):
+        """docker save 与压缩写入分线程并行，直接写入目标目录，同时计算tar的SHA256"""
+        os.makedirs(self.remote_path, exist_ok=True)
+        part_path = self.part_path()
+        print(f"\n正在保存并压缩镜像到 {os.path.join(self.remote_path, self.image_info['archive_name'])}...")
+
+        chunks_queue = queue.Queue(maxsize=STREAM_QUEUE_SIZE)
+        stop = threading.Event()
+        producer = threading.Thread(target=self.produce_chunks, args=(chunks_queue, stop), daemon=True)
+        producer.start()
+        try:
+            chunks = self.iter_queue(chunks_queue)
+            first = next(chunks, b'')
+            digest = hashlib.sha256()
+            with contextlib.ExitStack() as stack:
+                sink = self.open_sink(stack, part_path, first)
+                digest.update(first)
+                sink.write(first)
+                for chunk in chunks:
+                    digest.update(chunk)
+                    sink.write(chunk)
         except Exception as e:
             print(f"压缩失败: {str(e)}")
             raise
+        finally:
+            stop.set()
+            producer.join()
 
-    def transfer_zip_file(self):
-        """传输zip文件"""
-        os.makedirs(self.remote_path, exist_ok=True)
-        dest = os.path.join(self.remote_path, self.image_info['zip_name'])
+        self.image_info['sha256'] = digest.hexdigest()
+        st = os.stat(part_path)
+        print(f"压缩完成，压缩包大小: {st.st_size / (1 << 20):.2f}MB")
+
+    def drop_page_cache(self, path):
+        """释放文件占用的页缓存，避免多GB压缩包挤占其他进程的缓存"""
+        if not hasattr(os, 'posix_fadvise'):
+            return
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+
+    def transfer_archive(self):
+        """将写完的压缩包转为正式文件并生成校验文件"""
+        dest = os.path.join(self.remote_path, self.image_info['archive_name'])
         try:
-            shutil.move(self.image_info['zip_name'], dest)
+            os.replace(self.part_path(), dest)
+            # 生成 sha256sum 格式的校验文件，解压后可用 sha256sum -c 校验tar包
+            with open(os.path.join(self.remote_path, self.image_info['checksum_name']), 'w') as f:
+                f.write(f"{self.image_info['sha256']}  {self.image_info['tar_name']}\n")
+            self.drop_page_cache(dest)
             print(f"\n文件已成功传输至: {dest}")
         except Exception as e:
             print(f"文件传输失败: {str(e)}")
@@ -257,15 +620,111 @@ class DockerImageManager:
 
     def clean_temp_files(self):
         """清理临时文件"""
-        if os.path.exists(self.image_info['tar_name']):
-            os.remove(self.image_info['tar_name'])
-            print(f"已删除临时文件: {self.image_info['tar_name']}")
-        if os.path.exists(self.image_info['zip_name']):
-            os.remove(self.image_info['zip_name'])
-            print(f"已删除临时文件: {self.image_info['zip_name']}")
+        part_path = self.part_path()
+        if not part_path:
+            return
+        try:
+            os.unlink(part_path)
+            print(f"已删除临时文件: {part_path}")
+        except FileNotFoundError:
+            pass
+
+    def load_instructions(self):
+        """生成目标机器上的加载命令"""
+        archive = os.path.basename(self.image_info['archive_name'])
+        if self.compression == 'zip':
+            return f"unzip {archive}\n   docker load -i {self.image_info['tar_name']}"
+        if self.compression == 'zstd':
+            return f"zstd -dc {archive} | docker load"
+        # docker load 可直接读取 gzip 压缩的tar包
+        return f"docker load -i {archive}"
+
+    def registry_address(self):
+        """解析 local_registry 为 (主机, 端口)，未写端口时默认5000"""
+        host, sep, port = self.local_registry.rpartition(':')
+        if not sep or not port.isdigit():
+            return self.local_registry, REGISTRY_DEFAULT_PORT
+        return host, port
+
+    def ensure_local_registry(self):
+        """确保本地registry容器在运行"""
+        if self.api is not None:
+            containers = self.api.containers(all=True, filters={'name': f"^{REGISTRY_CONTAINER}$"})
+            state = containers[0]['State'] if containers else ''
+        else:
+            result = subprocess.run(
+                [DOCKER_CLI, 'ps', '-a', '--filter', f"name=^{REGISTRY_CONTAINER}$", '--format', '{{.State}}'],
+                capture_output=True,
+                text=True,
+                check=True
+            )
+            state = result.stdout.strip()
+        if state == 'running':
+            return
+        if state:
+            if self.api is not None:
+                self.api.start(REGISTRY_CONTAINER)
+            else:
+                subprocess.run([DOCKER_CLI, 'start', REGISTRY_CONTAINER], check=True)
+            return
+
+        host, port = self.registry_address()
+        print(f"\n启动本地registry: {host}:{port}")
+        # 创建容器仍使用命令行，docker run 会自动拉取registry镜像
+        subprocess.run(
+            [
+                DOCKER_CLI, 'run', '-d',
+                '--restart=always',
+                '-p', f"{port}:5000",
+                '--name', REGISTRY_CONTAINER,
+                'registry:2'
+            ],
+            check=True
+        )
+
+    def push_to_registry(self):
+        """推送到本地registry，按层去重，只传输目标端缺少的层"""
+        self.ensure_local_registry()
+        host, port = self.registry_address()
+        tag = self.image_info['original_tag']
+        repository = f"{host}:{port}/{self.image_info['pulled_ref'].rsplit(':', 1)[0]}"
+        registry_ref = f"{repository}:{tag}"
+        print(f"\n正在推送镜像: {registry_ref}", flush=True)
+        if self.api is not None:
+            self.api.tag(self.image_info['pulled_ref'], repository, tag)
+        else:
+            subprocess.run([DOCKER_CLI, 'tag', self.image_info['pulled_ref'], registry_ref], check=True)
+        try:
+            if self.api is not None:
+                self.print_stream_events(
+                    self.api.push(repository, tag=tag, stream=True, decode=True),
+                    "镜像推送失败"
+                )
+            else:
+                subprocess.run([DOCKER_CLI, 'push', registry_ref], check=True)
+        except subprocess.CalledProcessError:
+            raise RuntimeError("镜像推送失败")
+        finally:
+            # 只移除临时标签，镜像层已在registry中
+            self.remove_images([registry_ref])
+        self.image_info['registry_ref'] = registry_ref
+
+    def image_refs(self):
+        """待清理的全部镜像引用"""
+        refs = [self.image_info['pulled_ref']]
+        if self.image_info['mirror_ref']:
+            refs.append(self.image_info['mirror_ref'])
+        return refs
 
     def check_container_usage(self):
         """检查镜像是否被使用"""
+        if self.api is not None:
+            return bool(self.api.containers(
+                all=True,
+                quiet=True,
+                filters={'ancestor': self.image_info['pulled_ref']}
+            ))
+
         result = subprocess.run(
             [DOCKER_CLI, 'ps', '-a', '-q', '--filter', f"ancestor={self.image_info['pulled_ref']}"],
             capture_output=True,
@@ -273,46 +732,127 @@ class DockerImageManager:
         )
         return bool(result.stdout.strip())
 
+    def remove_images(self, refs):
+        """删除镜像，镜像已不存在时视为成功"""
+        if self.api is not None:
+            removed = True
+            for ref in refs:
+                try:
+                    self.api.remove_image(ref)
+                except docker.errors.ImageNotFound:
+                    pass
+                except docker.errors.APIError as e:
+                    print(f"删除镜像失败: {str(e)}")
+                    removed = False
+            return removed
+
+        result = subprocess.run(
+            [DOCKER_CLI, 'rmi', *refs],
+            capture_output=True,
+            text=True
+        )
+        errors = [
+            line for line in result.stderr.splitlines()
+            if line.strip() and 'No such image' not in line
+        ]
+        for line in errors:
+            print(line)
+        return result.returncode == 0 or not errors
+
+    def load_pending(self):
+        try:
+            with open(PENDING_FILE) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return []
+
+    def save_pending(self, pending):
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(PENDING_FILE, 'w') as f:
+            json.dump(pending, f)
+
     def schedule_cleanup(self):
-        """安排24小时后删除镜像"""
+        """记录24小时后删除镜像，由之后的运行负责清理"""
         try:
-            deletion_time = (datetime.now() + timedelta(hours=24)).strftime("%H:%M %Y-%m-%d")
-            cmd = f'echo "{DOCKER_CLI} rmi {self.image_info["pulled_ref"]}" | at {deletion_time}'
-            result = subprocess.run(cmd, shell=True, capture_output=True, text=True)
-            
-            if result.returncode == 0:
-                job_id = re.search(r'job (\d+)', result.stdout).group(1)
-                print(f"\n已安排24小时后自动清理镜像（任务ID: {job_id}）")
-            else:
-                print("\n警告：定时任务创建失败，请手动执行以下命令删除：")
-                print(f"{DOCKER_CLI} rmi {self.image_info['pulled_ref']}")
-                
+            pending = self.load_pending()
+            pending.append({
+                'refs': self.image_refs(),
+                'expires': time.time() + 24 * 3600
+            })
+            self.save_pending(pending)
+            expires = (datetime.now() + timedelta(hours=24)).strftime("%Y-%m-%d %H:%M")
+            print(f"\n已记录延迟清理，{expires} 之后再次运行本工具时自动删除镜像")
         except Exception as e:
             print(f"\n定时任务错误: {str(e)}")
+            print("请手动执行以下命令删除：")
+            print(f"{DOCKER_CLI} rmi {' '.join(self.image_refs())}")
+
+    def sweep_pending_cleanup(self):
+        """删除已到期的延迟清理镜像，失败只警告，不影响本次下载"""
+        try:
+            pending = self.load_pending()
+            if not pending:
+                return
+            if not isinstance(pending, list):
+                raise ValueError("记录格式应为列表")
+
+            now = time.time()
+            remaining = []
+            for entry in pending:
+                if entry['expires'] > now:
+                    remaining.append(entry)
+                    continue
+                if self.remove_images(entry['refs']):
+                    print(f"已清理到期镜像: {' '.join(entry['refs'])}")
+                else:
+                    remaining.append(entry)
+
+            if len(remaining) != len(pending):
+                self.save_pending(remaining)
+        except Exception as e:
+            print(f"\n警告：延迟清理记录处理失败，已跳过（{PENDING_FILE}）: {str(e)}")
 
     def clean_image(self):
         """清理镜像"""
         if self.check_container_usage():
             print("\n镜像正在使用，保留不删除")
+            if self.image_info['mirror_ref']:
+                # 仅移除加速源标签
+                self.remove_images([self.image_info['mirror_ref']])
             return
 
         print("\n执行镜像清理...")
-        try:
-            subprocess.run(
-                [DOCKER_CLI, 'rmi', self.image_info['pulled_ref']],
-                check=True
-            )
-        except subprocess.CalledProcessError:
+        if not self.remove_images(self.image_refs()):
             print("立即删除失败，转为延迟删除")
             self.schedule_cleanup()
 
+    def print_registry_usage(self):
+        registry_ref = self.image_info['registry_ref']
+        print("\n" + "="*50)
+        print(f"""使用说明：
+1. 在目标机器执行（将 {self.registry_address()[0]} 替换为本机地址，并加入 insecure-registries）：
+   docker pull {registry_ref}
+   docker tag {registry_ref} {self.image_info['pulled_ref']}
+
+2. 验证镜像：
+   docker images | grep {self.image_info['original_name'].replace('/', '_')}""")
+
     def run(self):
         parser = argparse.ArgumentParser(description='Docker镜像下载打包工具')
         parser.add_argument('-i', '--image', help='镜像名称（格式: name[:tag]）')
+        parser.add_argument('--no-zip', action='store_true', help='不压缩，直接传输tar包')
+        parser.add_argument(
+            '--via', choices=['file', 'registry'], default='file',
+            help='传输方式：file 打包为文件（默认），registry 推送到本地registry'
+        )
         args = parser.parse_args()
 
         try:
             self.handle_config()
+            self.connect_api()
+            self.sweep_pending_cleanup()
+            if args.no_zip:
+                self.compression = 'none'
 
             if args.image:
                 self.parse_image_input(args.image)
@@ -330,10 +870,15 @@ class DockerImageManager:
             if self.image_info['mirror']:
                 self.rename_image()
             
+            if args.via == 'registry':
+                self.push_to_registry()
+                self.clean_image()
+                self.print_registry_usage()
+                return
+
             self.generate_filenames()
-            self.create_tar_package()
-            self.compress_to_zip()
-            self.transfer_zip_file()
+            self.save_and_compress_streaming()
+            self.transfer_archive()
             
             self.clean_image()
             self.clean_temp_files()
@@ -341,11 +886,13 @@ class DockerImageManager:
             print("\n" + "="*50)
             print(f"""使用说明：
 1. 在目标机器执行：
-   unzip {os.path.basename(self.image_info['zip_name'])}
-   docker load -i {self.image_info['tar_name']}
+   {self.load_instructions()}
 
 2. 验证镜像：
-   docker images | grep {self.image_info['original_name'].replace('/', '_')}""")
+   docker images | grep {self.image_info['original_name'].replace('/', '_')}
+
+3. 校验tar包（可选）：
+   tar包SHA256: {self.image_info['sha256']}（校验文件: {self.image_info['checksum_name']}）""")
 
         except KeyboardInterrupt:
             print("\n操作已取消")